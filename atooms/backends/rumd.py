@@ -113,8 +113,12 @@ class RUMD(object):
                     itg = rumd.IntegratorNVE(timeStep=dt)
                 self.rumd_simulation.SetIntegrator(itg)
 
-        # Copy of initial state
-        self._initial_sample = self.rumd_simulation.sample.Copy()
+        # Reference coordinates for the rmsd. We keep positions and
+        # images instead of a full copy of the initial sample. Single
+        # precision is enough to check targets on the rmsd.
+        sample = self.rumd_simulation.sample
+        self._initial_position = numpy.array(sample.GetPositions(), dtype=numpy.float32)
+        self._initial_image = numpy.array(sample.GetImages(), dtype=numpy.int64)
 
         # Hold a reference to the system
         # self.system = System(self.rumd_simulation.sample, self.rumd_simulation.potentialList)
@@ -159,18 +163,19 @@ class RUMD(object):
     @property
     def rmsd(self):
         """
-        Compute the mean square displacement between actual sample and the
-        reference sample.
+        Compute the root mean square displacement between actual sample
+        and the initial one.
         """
-        if self.rumd_simulation.sample is self._initial_sample:
-            raise Exception('rmsd between two references of the same system does not make sense (use deepecopy?)')
         ndim = 3  # hard coded
-        N = self.rumd_simulation.sample.GetNumberOfParticles()
-        L = [self.rumd_simulation.sample.GetSimulationBox().GetLength(i) for i in range(ndim)]
-        # Unfold positions using periodic image information
-        ref = self._initial_sample.GetPositions() + self._initial_sample.GetImages() * L
-        unf = self.rumd_simulation.sample.GetPositions() + self.rumd_simulation.sample.GetImages() * L
-        return (sum(sum((unf - ref)**2)) / N)**0.5
+        sample = self.rumd_simulation.sample
+        N = sample.GetNumberOfParticles()
+        L = numpy.array([sample.GetSimulationBox().GetLength(i) for i in range(ndim)],
+                        dtype=numpy.float32)
+        # Displacements in single precision, using periodic image
+        # information to unfold them
+        dr = numpy.asarray(sample.GetPositions(), dtype=numpy.float32) - self._initial_position
+        dr += (numpy.asarray(sample.GetImages()) - self._initial_image) * L
+        return float(numpy.sqrt(numpy.einsum('ij,ij->', dr, dr) / N))
 
     def write_checkpoint(self, output_path):
         with Trajectory(output_path + '.chk', 'w') as t:
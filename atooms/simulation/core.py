@@ -24,6 +24,12 @@ import os
 import time
 import datetime
 import logging
+import heapq
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 import atooms.core.progress
 from atooms.core import __version__
@@ -69,11 +75,15 @@ class Simulation(object):
 
     def __init__(self, backend, output_path=None, steps=0,
                  checkpoint_interval=0, enable_speedometer=False,
-                 restart=False):
+                 restart=False, threaded_io=False):
         """
         Perform a simulation using the specified `backend` and optionally
         write output to `output_path`. This can be a file or directory path.
 
+        If `threaded_io` is True, writes submitted by observers via
+        `submit_io()` are performed by a background thread while the
+        simulation goes on.
+
         Paths: to define output paths we rely on `output_path`, all
         other paths are defined based on it and on its base_path.
         """
@@ -81,6 +91,7 @@ class Simulation(object):
         self.output_path = output_path
         self.steps = steps
         self._restart = restart
+        self.threaded_io = threaded_io
         self.current_step = 0
         self.initial_step = 0
         # We expect subclasses to keep a ref to the trajectory class
@@ -96,12 +107,19 @@ class Simulation(object):
             mkdir(os.path.dirname(self.output_path))
 
         # Internal variables
-        self._callback = []
+        self._callback = []  # writers first, then targets
+        self._writers = []
+        self._targets = []
         self._start_time = time.time()
         self._speedometer = None
         self._checkpoint_scheduler = Scheduler(checkpoint_interval)
         self._targeter_steps = target_steps
         self._cbk_params = {}  # hold scheduler and parameters of callbacks
+        self._io_queue = None
+        self._io_thread = None
+        self._io_error = None
+        self._rmsd_cache = (None, None)  # step and rmsd value
+        self._heap = None  # next steps of observers, see run()
         if enable_speedometer:
             self._speedometer = Speedometer()
             self.add(self._speedometer, Scheduler(self.steps, calls=20))
@@ -119,6 +137,7 @@ class Simulation(object):
     @system.setter
     def system(self, value):
         self.backend.system = value
+        self._rmsd_cache = (None, None)
 
     def __str__(self):
         return 'atooms simulation via %s' % self.backend
@@ -153,21 +172,31 @@ class Simulation(object):
 
         # Store scheduler, callback and its arguments
         # in a separate dict (NOT in the function object itself!)
+        # We also store whether the callback is a targeter once and for all
+        is_target = 'target' in _callable_name(callback)
         self._cbk_params[callback] = {'scheduler': scheduler,
                                       'args': args,
-                                      'kwargs': kwargs}
+                                      'kwargs': kwargs,
+                                      'target': is_target}
 
-        # Keep targeters last
-        if 'target' not in _callable_name(callback):
-            self._callback.insert(0, callback)
+        # Keep targeters last. The lists are replaced, not modified,
+        # so that observers may add others while being notified.
+        if not is_target:
+            self._writers = [callback] + self._writers
         else:
-            self._callback.append(callback)
+            self._targets = self._targets + [callback]
+        self._callback = self._writers + self._targets
+        self._heap = None
 
     def remove(self, callback):
         """Remove the observer `callback`."""
         if callback in self._callback:
-            self._callback.remove(callback)
-            self._cbk_params.pop(callback)
+            if self._cbk_params.pop(callback)['target']:
+                self._targets = [c for c in self._targets if c is not callback]
+            else:
+                self._writers = [c for c in self._writers if c is not callback]
+            self._callback = self._writers + self._targets
+            self._heap = None
         else:
             _log.debug('attempt to remove inexistent callback %s (dont worry)', callback)
 
@@ -175,19 +204,71 @@ class Simulation(object):
         self.remove(callback)
 
     def _notify(self, observers):
+        debug = _log.isEnabledFor(logging.DEBUG)
         for observer in observers:
-            _log.debug('notify %s at step %d', observer, self.current_step)
-            args = self._cbk_params[observer]['args']
-            kwargs = self._cbk_params[observer]['kwargs']
-            observer(self, *args, **kwargs)
+            if debug:
+                _log.debug('notify %s at step %d', observer, self.current_step)
+            params = self._cbk_params[observer]
+            observer(self, *params['args'], **params['kwargs'])
+
+    def submit_io(self, func, *args, **kwargs):
+        """
+        Call `func(*args, **kwargs)` to perform some output.
+
+        During a run with `threaded_io` enabled, the call is queued
+        and performed by the I/O thread, so the arguments must not be
+        modified afterwards. Otherwise, it is performed right away.
+        """
+        if self._io_queue is None:
+            func(*args, **kwargs)
+        else:
+            self._io_queue.put((func, args, kwargs))
+
+    def _start_io(self):
+        self._io_error = None
+        self._io_queue = queue.Queue()
+        self._io_thread = threading.Thread(target=self._io_loop)
+        self._io_thread.daemon = True
+        self._io_thread.start()
+
+    def _io_loop(self):
+        while True:
+            task = self._io_queue.get()
+            try:
+                if task is None:
+                    return
+                func, args, kwargs = task
+                # Skip further output once a write has failed
+                if self._io_error is None:
+                    func(*args, **kwargs)
+            except Exception as error:
+                _log.error('output failed in I/O thread')
+                self._io_error = error
+            finally:
+                self._io_queue.task_done()
+
+    def _join_io(self):
+        """Wait until all queued output is done and report errors."""
+        if self._io_queue is not None:
+            self._io_queue.join()
+        if self._io_error is not None:
+            error, self._io_error = self._io_error, None
+            raise error
+
+    def _stop_io(self):
+        if self._io_thread is not None:
+            self._io_queue.put(None)
+            self._io_thread.join()
+            self._io_queue = None
+            self._io_thread = None
 
     @property
     def _targeters(self):
-        return [o for o in self._callback if 'target' in _callable_name(o)]
+        return self._targets
 
     @property
     def _non_targeters(self):
-        return [o for o in self._callback if 'target' not in _callable_name(o)]
+        return self._writers
 
     @property
     def _speedometers(self):
@@ -241,13 +322,25 @@ class Simulation(object):
                     # Trajectory will not store the interaction,
                     # thermostat, barostat, so we must preserve it
                     self.system.update(t[0])
+        self._rmsd_cache = (None, None)
 
     @property
     def rmsd(self):
-        if hasattr(self.backend, 'rmsd'):
-            return self.backend.rmsd
-        else:
-            return 0.0
+        """
+        Root mean squared displacement of the backend.
+
+        The value is cached until the simulation advances, so that
+        observers notified at the same step compute it only once.
+        """
+        if self._rmsd_cache[0] == self.current_step:
+            return self._rmsd_cache[1]
+        # Note: hasattr() would evaluate the backend property once more
+        try:
+            value = self.backend.rmsd
+        except AttributeError:
+            value = 0.0
+        self._rmsd_cache = (self.current_step, value)
+        return value
 
     def _elapsed_wall_time(self):
         """Elapsed wall time in seconds."""
@@ -283,6 +376,7 @@ class Simulation(object):
         """
         self.backend.run(steps - self.current_step)
         self.current_step = steps
+        self._rmsd_cache = (None, None)
 
     def run(self, steps=None):
         """Run the simulation."""
@@ -302,7 +396,8 @@ class Simulation(object):
             intervals = [self._cbk_params[cbk]['scheduler'].interval for cbk in self._callback]
             intervals = [intv for intv in intervals if intv is not None]
             min_iters = 10
-            if min(intervals) > (self.current_step + self.steps) / min_iters and \
+            if len(intervals) > 0 and \
+               min(intervals) > (self.current_step + self.steps) / min_iters and \
                (self.current_step + self.steps) / min_iters > 10 :
                 def flush(sim):
                     pass
@@ -338,6 +433,8 @@ class Simulation(object):
             s._init = False
         from atooms.core.progress import progress
         bar = progress(total=self.steps)
+        if self.threaded_io:
+            self._start_io()
 
         try:
             # Before entering the simulation, check if we can quit right away
@@ -351,24 +448,44 @@ class Simulation(object):
                 self._notify(self._speedometers)
             _log.info('starting at step: %d', self.current_step)
             _log.info('')
+            next_checkpoint = self._checkpoint_scheduler(self)
             while True:
-                # Run simulation until any of the observers need to be called
-                all_steps = [self._cbk_params[c]['scheduler'](self) for c in self._callback]
-                next_checkpoint = self._checkpoint_scheduler(self)
-                next_step = min(all_steps + [next_checkpoint])
+                # The heap holds the next step of each observer along
+                # with its index in self._callback. Only the schedulers
+                # of notified observers are called again, and the heap
+                # is rebuilt when observers are added or removed.
+                if self._heap is None:
+                    self._heap = [(self._cbk_params[c]['scheduler'](self), i)
+                                  for i, c in enumerate(self._callback)]
+                    heapq.heapify(self._heap)
 
+                # Run simulation until any of the observers need to be called
+                next_step = min(self._heap[0][0], next_checkpoint)
                 self.run_until(next_step)
 
-                # Find observers indexes corresponding to minimum step
-                # then get all corresponding observers
-                next_step_ids = [i for i, step in enumerate(all_steps) if step == next_step]
-                next_observers = [self._callback[i] for i in next_step_ids]
+                # Pop observers indexes corresponding to minimum step
+                # and reschedule them
+                next_step_ids = []
+                while self._heap and self._heap[0][0] == next_step:
+                    next_step_ids.append(heapq.heappop(self._heap)[1])
+                for i in next_step_ids:
+                    scheduler = self._cbk_params[self._callback[i]]['scheduler']
+                    heapq.heappush(self._heap, (scheduler(self), i))
 
                 # Observers should be sorted such that targeters are
-                # last to avoid cropping output files
-                self._notify(next_observers)
+                # last to avoid cropping output files. Nothing to do
+                # when only the checkpoint is due.
+                if next_step_ids:
+                    next_observers = [self._callback[i] for i in sorted(next_step_ids)]
+                    self._notify(next_observers)
+                if self._io_error is not None:
+                    self._join_io()
                 if self.current_step == next_checkpoint:
+                    # Queued output must be on disk before a restart
+                    # from this checkpoint is possible
+                    self._join_io()
                     self.write_checkpoint()
+                    next_checkpoint = self._checkpoint_scheduler(self)
 
                 # Update progress bar
                 bar.update(self.current_step)
@@ -377,6 +494,8 @@ class Simulation(object):
             # Checkpoint configuration at last step
             bar.update(self.current_step)
             bar.close()
+            # Make sure pending output is on disk
+            self._join_io()
             _log.info('simulation ended successfully: %s', end)
             self.write_checkpoint()
             _report(self._info_end())
@@ -391,6 +510,9 @@ class Simulation(object):
             _log.error('simulation failed')
             raise
 
+        finally:
+            self._stop_io()
+
     def _info_start(self):
         now = datetime.datetime.now().strftime('%Y-%m-%d at %H:%M')
         txt = """\
@@ -416,7 +538,7 @@ class Simulation(object):
         for f in self._callback:
             params = self._cbk_params[f]
             s = params['scheduler']
-            if 'target' in _callable_name(f):
+            if params['target']:
                 args = params['args']
                 txt.append('target %s: %s' % (_callable_name(f), args[0]))
             else:
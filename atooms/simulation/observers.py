@@ -35,6 +35,7 @@ Of course, general purpose callback can be passed to do whatever.
 
 import sys
 import os
+import copy
 import shutil
 import time
 import datetime
@@ -81,6 +82,9 @@ class WallTimeLimit(Exception):
 
 # Scheduler classes
 
+# Step returned by schedulers of observers that will not be notified
+NEVER = sys.maxsize
+
 class Scheduler(object):
 
     """
@@ -113,43 +117,77 @@ class Scheduler(object):
         if self.calls is not None and self.calls <= 0:
             self.calls = None
 
-    def __call__(self, sim):
-        """
-        Given a simulation instance `sim`, return the next step at which
-        the observer will be called.
-        """
+        # Select once and for all the method that computes the next
+        # step, since the scheduler is called at every notification
         if self.interval is not None and self.calls is None:
-            # Regular interval
-            return (sim.current_step // self.interval + 1) * self.interval
-
+            self._next = self._next_interval
         elif self.calls is not None:
-            # Fixed number of calls
-            interval = max(1, sim.steps // self.calls)
-            return (sim.current_step // interval + 1) * interval
-
+            self._next = self._next_calls
         elif self.steps is not None:
-            # List of selected steps
-            inext = sys.maxsize
-            for i, step in enumerate(self.steps):
-                if step > sim.current_step:
-                    inext = self.steps[i]
-                    break
-            return inext
-
+            self._next = self._next_steps
         elif self.block is not None:
-            # Periodic block of steps
-            step_of_last_block = (sim.current_step // self.block[-1]) * self.block[-1]
-            inext = sys.maxsize
-            for i, step in enumerate(self.block):
-                if step > sim.current_step % self.block[-1]:
-                    inext = self.block[i] + step_of_last_block
-                    break
-            return inext
-
+            self._next = self._next_block
         elif self.seconds is not None:
-            pass
+            self._next = self._next_seconds
         else:
-            return sys.maxsize
+            self._next = self._next_never
+
+    def __call__(self, sim):
+        """
+        Given a simulation instance `sim`, return the next step at which
+        the observer will be called.
+        """
+        return self._next(sim)
+
+    def _next_interval(self, sim):
+        # Regular interval
+        return (sim.current_step // self.interval + 1) * self.interval
+
+    def _next_calls(self, sim):
+        # Fixed number of calls
+        interval = max(1, sim.steps // self.calls)
+        return (sim.current_step // interval + 1) * interval
+
+    def _next_steps(self, sim):
+        # List of selected steps
+        inext = NEVER
+        for i, step in enumerate(self.steps):
+            if step > sim.current_step:
+                inext = self.steps[i]
+                break
+        return inext
+
+    def _next_block(self, sim):
+        # Periodic block of steps
+        step_of_last_block = (sim.current_step // self.block[-1]) * self.block[-1]
+        inext = NEVER
+        for i, step in enumerate(self.block):
+            if step > sim.current_step % self.block[-1]:
+                inext = self.block[i] + step_of_last_block
+                break
+        return inext
+
+    def _next_seconds(self, sim):
+        # Not implemented: the observer is never notified
+        return NEVER
+
+    def _next_never(self, sim):
+        return NEVER
+
+
+def _snapshot(system):
+    """
+    Return a copy of `system` whose particles and cell are not affected
+    by the subsequent evolution of the simulation.
+    """
+    snapshot = copy.copy(system)
+    try:
+        snapshot.particle = copy.deepcopy(system.particle)
+        snapshot.cell = copy.deepcopy(system.cell)
+    except AttributeError:
+        # Particles cannot be set in some backends' systems
+        snapshot = copy.deepcopy(system)
+    return snapshot
 
 
 # Writer callbacks
@@ -184,12 +222,22 @@ def write_config(sim, fields=None, precision=None):
         rmd(sim.output_path)
         rmf(sim.output_path)
 
-    with sim.trajectory_class(sim.output_path, 'a') as t:
+    # With threaded output the system is written later on, so we
+    # pass a copy of it
+    system = sim.system
+    if sim.threaded_io:
+        system = _snapshot(system)
+    sim.submit_io(_write_config, sim.trajectory_class, sim.output_path,
+                  system, sim.current_step, fields, precision)
+
+
+def _write_config(trajectory_class, output_path, system, step, fields, precision):
+    with trajectory_class(output_path, 'a') as t:
         if precision is not None:
             t.precision = precision
         if fields is not None:
             t.fields = fields
-        t.write(sim.system, sim.current_step)
+        t.write(system, step)
 
 
 def write_thermo(sim, fields=None, fmt=None, precision=6, functions=None):
@@ -320,10 +368,13 @@ def target(sim, attribute, value):
 
     Return: the ratio between current and target values of the attribute.
     """
-    x = float(getattr(sim, attribute))
+    x = getattr(sim, attribute)
+    if type(x) is not float:
+        x = float(x)
     if value > 0:
-        frac = float(x) / value
-        _log.debug('target %s now at %g [%d]', attribute, x, int(frac * 100))
+        frac = x / value
+        if _log.isEnabledFor(logging.DEBUG):
+            _log.debug('target %s now at %g [%d]', attribute, x, int(frac * 100))
     if x >= value:
         raise SimulationEnd('reached target %s: %s', attribute, value)
     return frac
@@ -347,12 +398,11 @@ def target_walltime(sim, value):
     limits.
     """
     wtime_limit = value
-    if sim.wall_time() > wtime_limit:
+    t = sim.wall_time()
+    if t > wtime_limit:
         raise SimulationEnd('target wall time reached')
-    else:
-        t = sim.wall_time()
-        dt = wtime_limit - t
-        _log.debug('elapsed time %g, reamining time %g', t, dt)
+    elif _log.isEnabledFor(logging.DEBUG):
+        _log.debug('elapsed time %g, reamining time %g', t, wtime_limit - t)
 
 
 def target_python_stop(sim, condition):
@@ -400,14 +450,14 @@ def shell_stop(sim, cmd, exit_code=1):
         output = subprocess.check_output(wrap_cmd, shell=True,
                                          stderr=subprocess.STDOUT, executable="/bin/bash")
         if len(output) > 0:
-            _log.info('shell command "{}" returned: {}'.format(cmd, output.strip()))
+            _log.info('shell command "%s" returned: %s', cmd, output.strip())
 
     except subprocess.CalledProcessError as e:
         # We stop the simulation
         if e.returncode == exit_code:
             raise SimulationEnd('shell command "{}" returned "{}"'.format(cmd, e.output.strip()))
         else:
-            _log.error('shell command {} failed with output {}'.format(cmd, e.output))
+            _log.error('shell command %s failed with output %s', cmd, e.output)
             raise
 
 def user_stop(sim):
@@ -449,7 +499,7 @@ class Speedometer(object):
             for c in sim._callback:
                 if c is self:
                     continue
-                if 'target' in c.__name__.lower():
+                if sim._cbk_params[c]['target']:
                     self._callback = c
                     args = sim._cbk_params[c]['args']
                     kwargs = sim._cbk_params[c]['kwargs']
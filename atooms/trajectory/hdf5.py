@@ -10,6 +10,7 @@ import copy
 
 from .base import TrajectoryBase
 from atooms.core import ndim
+from atooms.core.utils import rank, size, comm
 from atooms.system import System
 from atooms.system.particle import Particle
 from atooms.system.cell import Cell
@@ -30,15 +31,71 @@ class _SafeFile(h5py.File):
         if group not in self:
             self.create_group(group)
 
+def _read_list_h5(node):
+    """
+    Return the per-sample values stored in `node` as a list.
+
+    The values are read at once from a one-dimensional dataset. In
+    the legacy layout, they are the first entries of the datasets in
+    group `node`.
+    """
+    if isinstance(node, h5py.Dataset):
+        return node[:].tolist()
+    else:
+        return [entry[0] for entry in node.values()]
+
 def _get_cached_list_h5(fh, h5g, data):
     """ Replace |data| with read data in group |h5g| only if data is None """
     if data is None:
         try:
-            data = [entry[0] for entry in fh[h5g].values()]
+            data = _read_list_h5(fh[h5g])
         except:
             data = []
     return data
 
+def _dump(system, attr, dtype=None):
+    """
+    Return the particles' `attr` property as a single array, whose
+    first axis runs over the particles.
+
+    The array is always built anew from the particles' properties,
+    even if the system holds a view dump of them.
+    """
+    if len(system.particle) == 0:
+        # Keep the shape of the property when there are no particles
+        shape = (0, )
+        if attr in ['position', 'velocity']:
+            shape += (ndim if system.cell is None else len(system.cell.side), )
+        return numpy.empty(shape, dtype=dtype)
+    return numpy.array([getattr(p, attr) for p in system.particle], dtype=dtype)
+
+def _chunks(shape, itemsize, frames=64, size=2**20):
+    """
+    Return the chunk shape of an extensible dataset holding frames of
+    the given `shape`.
+
+    Chunks hold at most `frames` frames and, when possible, do not
+    exceed `size` bytes. Chunk dimensions are at least 1, even for
+    frames without particles.
+    """
+    shape = tuple(max(1, n) for n in shape)
+    nbytes = itemsize * int(numpy.prod(shape))
+    return (max(1, min(frames, size // nbytes)), ) + shape
+
+def _encode(data):
+    """Return an array of encoded strings from an array of strings."""
+    # numpy.char functions return float arrays when data are empty
+    if len(data) == 0:
+        return numpy.asarray(data).astype(bytes)
+    return numpy.char.encode(data)
+
+def _decode(data):
+    """Return a list of stripped strings from an array of encoded strings."""
+    data = numpy.asarray(data).astype(bytes)
+    if len(data) == 0:
+        return []
+    return numpy.char.strip(numpy.char.decode(data)).tolist()
+
 def _write_datasets(fh, group, datasets):
     """Write several data sets stored in datasets dict in group of fh"""
     for name, dataset in datasets.items():
@@ -77,39 +134,78 @@ def add_interaction_hdf5(finp, ff):
 
 class TrajectoryHDF5(TrajectoryBase):
 
-    """Trajectory layout based on HDF5 library. """
+    """
+    Trajectory layout based on HDF5 library.
+
+    If `parallel` is True and several MPI processes are running, the
+    file is opened with the MPI-IO driver and `read_samples()`
+    distributes the reads among the processes. This is only possible
+    in read mode.
+    """
 
     suffix = 'h5'
 
-    def __init__(self, filename, mode='r+'):
+    def __init__(self, filename, mode='r+', parallel=False):
         super(TrajectoryHDF5, self).__init__(filename, mode)
 
         self.general_info = {}
         self._grandcanonical = False
         self._system = None
         self.fields = ['position', 'velocity', 'cell']
+        self.compression = None
+        """Compression filter of per-sample datasets, e.g. 'gzip' or 'lzf'."""
+        self.flush_every = 1
+        """Number of samples buffered in memory before writing them to disk."""
+        self._buffer = {}
+        self._buffered_samples = 0
+        self._datasets = {}
+        self._samples = None
+        self._sample_writers = None
+
+        self.parallel = parallel and size > 1
+        if self.parallel:
+            if self.mode != 'r':
+                raise ValueError('parallel access to file %s only in read mode' % self.filename)
+            self.trajectory = h5py.File(self.filename, self.mode, driver='mpio', comm=comm)
+        elif self.mode == 'r':
+            self.trajectory = h5py.File(self.filename, self.mode)
+        elif self.mode == 'r+' or self.mode == 'w' or self.mode == 'w-':
+            self.trajectory = _SafeFile(self.filename, self.mode)
+            self._create_layout()
+        else:
+            raise ValueError('Specify mode (r/w) for file %s (invalid: %s)' % (self.filename, self.mode))
 
         if self.mode == 'r' or self.mode == 'r+':
-            self.trajectory = h5py.File(self.filename, mode)
             # gather general info on file
             for entry in self.trajectory['/']:
                 if type(self.trajectory[entry]) == h5py.Dataset:
                     self.general_info[entry] = self.trajectory[entry]
 
-        elif self.mode == 'w' or self.mode == 'r+' or self.mode == "w-":
-            self.trajectory = _SafeFile(self.filename, self.mode)
-
-        else:
-            raise ValueError('Specify mode (r/w) for file %s (invalid: %s)' % (self.filename, self.mode))
+    def _create_layout(self):
+        """Create once and for all the groups common to all writers."""
+        for group in ['/initialstate', '/trajectory', '/trajectory/realtime']:
+            self.trajectory.create_group_safe(group)
 
     def read_steps(self):
-        return [d[0] for d in self.trajectory['trajectory/realtime/stepindex'].values()]
+        return _read_list_h5(self.trajectory['trajectory/realtime/stepindex'])
 
     def read_len(self):
+        if self._buffered_samples > 0:
+            self.flush()
         return len(self.trajectory['trajectory/realtime/stepindex'])
 
+    def flush(self):
+        """Write the buffered samples to disk."""
+        for path, entry in self._buffer.items():
+            self._flush_buffer(path, entry)
+        self._buffered_samples = 0
+        self.trajectory.flush()
+
     def close(self):
         try:
+            if self._buffered_samples > 0:
+                self.flush()
+            self._datasets = {}
             self.trajectory.close()
         except ValueError:
             _log.error('file %s already closed', self.filename)
@@ -123,8 +219,6 @@ class TrajectoryHDF5(TrajectoryBase):
             return 1.0
 
     def write_timestep(self, value):
-        self.trajectory.create_group_safe('/trajectory')
-        self.trajectory.create_group_safe('/trajectory/realtime')
         self.trajectory['trajectory/realtime/timestep'] = [value]
 
     def read_block_size(self):
@@ -134,16 +228,13 @@ class TrajectoryHDF5(TrajectoryBase):
             return None
 
     def write_block_size(self, value):
-        self.trajectory.create_group_safe('/trajectory')
-        self.trajectory.create_group_safe('/trajectory/realtime')
         self.trajectory['trajectory/realtime/block_period'] = [value]
 
     def write_init(self, system):
         from atooms.system.particle import distinct_species
-        self.trajectory.create_group_safe('/initialstate')
         self.trajectory['DIMENSIONS'] = [3]
         self.trajectory['NAME_SYS'] = [b'Unknown']
-        self.trajectory['VERSION_TRJ'] = [b'1.2']
+        self.trajectory['VERSION_TRJ'] = [b'1.3']
         self.trajectory['VERSION_MD'] = [b'X.X.X']
 
         # Particles
@@ -152,14 +243,15 @@ class TrajectoryHDF5(TrajectoryBase):
             self.trajectory.create_group_safe(group)
             particle = system.particle
             species = distinct_species(particle)
+            spe = _dump(system, 'species', dtype=str)
             particle_h5 = {'number_of_species': [len(species)],
                            'number_of_particles': [len(particle)],
-                           'identity': [species.index(p.species)+1 for p in particle],
-                           'element': [p.species.encode() for p in particle],
-                           'mass': [p.mass for p in particle],
-                           'radius': [p.radius for p in particle],
-                           'position': [p.position for p in particle],
-                           'velocity': [p.velocity for p in particle],
+                           'identity': numpy.searchsorted(species, spe) + 1,
+                           'element': _encode(spe),
+                           'mass': _dump(system, 'mass', dtype=numpy.float64),
+                           'radius': _dump(system, 'radius', dtype=numpy.float64),
+                           'position': _dump(system, 'position', dtype=numpy.float64),
+                           'velocity': _dump(system, 'velocity', dtype=numpy.float64),
                            }
             _write_datasets(self.trajectory, group, particle_h5)
 
@@ -204,7 +296,6 @@ class TrajectoryHDF5(TrajectoryBase):
 
     def write_interaction(self, interaction):
         rgr = '/initialstate/interaction/'
-        self.trajectory.create_group_safe('/initialstate/')
         # If the group exisist we delete it. This does not actual clear space in h5 file.
         # We could do it on a dataset basis via require_dataset, or visit the group and delete everything.
         try:
@@ -233,45 +324,186 @@ class TrajectoryHDF5(TrajectoryBase):
                 self.trajectory[pgr + 'lookup_points'] = [phi.npoints]
 
     def write_sample(self, system, step):
-        self.trajectory.create_group_safe('/trajectory')
-        self.trajectory.create_group_safe('/trajectory/realtime')
-        self.trajectory.create_group_safe('/trajectory/realtime/stepindex')
-        self.trajectory.create_group_safe('/trajectory/realtime/sampleindex')
-
+        # Sample numbering is fortran style for backward compatibility
         frame = len(self.steps) + 1
-        csample = '/sample_%7.7i' % frame
 
+        # Per-sample data are written by functions specialized for
+        # the current fields, which are set up at the first sample
+        key = (tuple(self.fields), system.particle is not None, system.cell is not None)
+        if self._sample_writers is None or self._sample_writers[0] != key:
+            self._sample_writers = (key, self._setup_sample_writers(*key))
+        for write in self._sample_writers[1]:
+            write(system, frame - 1)
+
+        # The sample is indexed once its data have been written
         try:
-            self.trajectory['/trajectory/realtime/stepindex' + csample] = [step]
-            self.trajectory['/trajectory/realtime/sampleindex' + csample] = [frame]
+            self._write_frame('/trajectory/realtime/stepindex', frame - 1,
+                              numpy.asarray(step, dtype=numpy.int64), frames=4096)
+            self._write_frame('/trajectory/realtime/sampleindex', frame - 1,
+                              numpy.asarray(frame, dtype=numpy.int64), frames=4096)
         except RuntimeError:
             _log.error('error when writing step %s sample %s to file %s', step, frame, self.filename)
             raise
 
-        if system.particle is not None:
-            self.trajectory.create_group_safe('/trajectory/particle')
-            if 'position' in self.fields:
-                self.trajectory.create_group_safe('/trajectory/particle/position')
-                self.trajectory['/trajectory/particle/position' + csample] = [p.position for p in system.particle]
-            if 'velocity' in self.fields:
-                self.trajectory['/trajectory/particle/velocity' + csample] = [p.velocity for p in system.particle]
-                self.trajectory.create_group_safe('/trajectory/particle/velocity')
-            if 'radius' in self.fields:
-                self.trajectory.create_group_safe('/trajectory/particle/radius')
-                self.trajectory['/trajectory/particle/radius' + csample] = [p.radius for p in system.particle]
-            if 'species' in self.fields:
-                self.trajectory.create_group_safe('/trajectory/particle/species')
-                data = ['%-3s' % p.species for p in system.particle]
-                self.trajectory['/trajectory/particle/species' + csample] = [_.encode() for _ in data]
-                from atooms.system.particle import distinct_species
-                ids = distinct_species(system.particle)
-                self.trajectory['/trajectory/particle/ids' + csample] = [1+ids.index(p.species) for p in system.particle]
-
-        if system.cell is not None:
-            self.trajectory.create_group_safe('/trajectory/cell')
-            if 'cell' in self.fields:
-                self.trajectory.create_group_safe('/trajectory/cell/sidebox')
-                self.trajectory['/trajectory/cell/sidebox' + csample] = system.cell.side
+        if self.flush_every > 1:
+            self._buffered_samples += 1
+            if self._buffered_samples >= self.flush_every:
+                self.flush()
+
+    def _setup_sample_writers(self, fields, has_particle, has_cell):
+        """
+        Return the list of functions that write the per-sample `fields`.
+
+        Each function takes a system and the frame index. Per-sample
+        data are appended to extensible datasets, whose first axis is
+        the frame index (starting from 0). Their groups are created
+        along with them.
+        """
+        def write_particle(attr):
+            path = '/trajectory/particle/' + attr
+            def write(system, frame):
+                self._write_frame(path, frame, _dump(system, attr, dtype=numpy.float64))
+            return write
+
+        def write_species(system, frame):
+            spe = _dump(system, 'species', dtype=str)
+            # Species ids follow the order of distinct_species()
+            ids = numpy.unique(spe, return_inverse=True)[1].reshape(spe.shape)
+            self._write_frame('/trajectory/particle/species', frame,
+                              _encode(numpy.char.ljust(spe, 3)))
+            self._write_frame('/trajectory/particle/ids', frame, ids + 1)
+
+        def write_cell(system, frame):
+            self._write_frame('/trajectory/cell/sidebox', frame,
+                              numpy.asarray(system.cell.side, dtype=numpy.float64))
+
+        def write_number(system, frame):
+            self._write_frame('/trajectory/particle/number_of_particles', frame,
+                              numpy.asarray(len(system.particle), dtype=numpy.int64), frames=4096)
+
+        writers = []
+        if has_particle:
+            writers.append(write_number)
+            for attr in ['position', 'velocity', 'radius']:
+                if attr in fields:
+                    writers.append(write_particle(attr))
+            if 'species' in fields:
+                writers.append(write_species)
+        if has_cell and 'cell' in fields:
+            writers.append(write_cell)
+        return writers
+
+    def _write_frame(self, path, frame, data, frames=64):
+        """
+        Store `data` at index `frame` of the extensible dataset `path`.
+
+        The dataset is created on first use with a chunked layout of
+        at most `frames` frames per chunk, optionally compressed
+        according to `self.compression`. The first axis of `data`,
+        i.e. the number of particles, may change across frames: the
+        dataset is then enlarged along this axis and shorter frames
+        are padded with zeros.
+
+        If `self.flush_every` is larger than one, `data` is copied in a
+        buffer of contiguous frames, which is written by `flush()`.
+        """
+        if self.flush_every <= 1:
+            self._write_block(path, frame, data[numpy.newaxis, ...], frames)
+            return
+
+        # Buffers are entries [first frame, number of frames, data,
+        # frames per chunk] and are reused after each flush
+        entry = self._buffer.get(path)
+        if entry is not None and entry[1] > 0 and \
+           (frame != entry[0] + entry[1] or entry[1] == len(entry[2])):
+            self._flush_buffer(path, entry)
+        if entry is None or len(entry[2]) != self.flush_every or \
+           entry[2].shape[1:] != data.shape or entry[2].dtype != data.dtype:
+            if entry is not None:
+                self._flush_buffer(path, entry)
+            entry = [frame, 0, numpy.empty((self.flush_every, ) + data.shape, dtype=data.dtype), frames]
+            self._buffer[path] = entry
+        if entry[1] == 0:
+            entry[0] = frame
+        entry[2][entry[1]] = data
+        entry[1] += 1
+
+    def _flush_buffer(self, path, entry):
+        if entry[1] > 0:
+            self._write_block(path, entry[0], entry[2][:entry[1]], entry[3])
+            entry[1] = 0
+
+    def _write_block(self, path, frame, data, frames):
+        """Store the frames in `data` starting at index `frame` of dataset `path`."""
+        # Handles and lengths of the datasets are cached to avoid
+        # looking up paths and shapes in the file at each frame
+        shape = data.shape[1:]
+        try:
+            entry = self._datasets[path]
+        except KeyError:
+            if path not in self.trajectory:
+                # The number of particles may change across frames
+                maxshape = (None, ) + shape
+                if len(shape) > 0:
+                    maxshape = (None, None) + shape[1:]
+                self.trajectory.create_dataset(path, shape=(0, ) + shape,
+                                               maxshape=maxshape,
+                                               chunks=_chunks(shape, data.dtype.itemsize, frames),
+                                               dtype=data.dtype,
+                                               compression=self.compression,
+                                               shuffle=self.compression is not None)
+            dataset = self.trajectory[path]
+            if not isinstance(dataset, h5py.Dataset):
+                raise ValueError('cannot append samples to legacy layout of file %s' % self.filename)
+            entry = self._datasets[path] = [dataset, dataset.shape[0], dataset.shape[1:]]
+        dataset, length, expected = entry
+        if expected != shape:
+            if len(expected) != len(shape) or expected[1:] != shape[1:]:
+                raise ValueError('cannot write {} with shape {} to file {} (expected {})'.format(
+                    path, shape, self.filename, expected))
+            if expected[0] < shape[0]:
+                dataset.resize(shape[0], axis=1)
+                entry[2] = expected = dataset.shape[1:]
+        if length < frame + len(data):
+            entry[1] = frame + len(data)
+            dataset.resize(entry[1], axis=0)
+        if data.size == 0:
+            # Frames without particles are left padded
+            return
+        if expected == shape:
+            dest = numpy.s_[frame: frame + len(data)]
+        else:
+            dest = numpy.s_[frame: frame + len(data), :shape[0]]
+        if data.dtype == dataset.dtype and data.flags.c_contiguous:
+            # Skip the conversions of the high-level interface
+            dataset.write_direct(data, dest_sel=dest)
+        else:
+            dataset[dest] = data
+
+    def _read_frames(self, path, frames, csamples):
+        """
+        Return the data stored at indices `frames` in `path`.
+
+        With the chunked layout, all frames are fetched with a single
+        selection of the dataset and returned as an array whose first
+        axis runs over `frames`. Trajectories written with the legacy
+        layout store each sample in its own dataset, whose names
+        `csamples` are used instead, and a list of arrays is returned.
+        """
+        node = self.trajectory[path]
+        if not isinstance(node, h5py.Dataset):
+            return [node[csample[1:]][:] for csample in csamples]
+        # h5py selections must be increasing and without repetitions
+        uniq, inverse = numpy.unique(frames, return_inverse=True)
+        if len(uniq) == 0:
+            return node[0:0]
+        if uniq[-1] - uniq[0] + 1 == len(uniq):
+            data = node[uniq[0]: uniq[-1] + 1]
+        else:
+            data = node[uniq.tolist()]
+        if len(uniq) == len(frames) and (uniq == frames).all():
+            return data
+        return data[inverse.ravel()]
 
     def read_init(self):
         # read particles
@@ -290,14 +522,11 @@ class TrajectoryHDF5(TrajectoryBase):
                 vel = group[entry][:]
             if entry == 'radius':
                 rad = group[entry][:]
-        if rad is not None:
-            particle = [Particle(species=spe[i].decode().strip(), mass=mas[i],
-                                 position=pos[i, :], velocity=vel[i, :],
-                                 radius=rad[i]) for i in range(n)]
-        else:
-            particle = [Particle(species=spe[i].decode().strip(), mass=mas[i],
-                                 position=pos[i, :], velocity=vel[i, :])
-                        for i in range(n)]
+        spe = _decode(spe[:n])
+        if rad is None:
+            rad = [Particle().radius] * n
+        particle = [Particle(species=s, mass=m, position=x, velocity=v, radius=r)
+                    for s, m, x, v, r in zip(spe, mas[:n], pos[:n], vel[:n], rad[:n])]
 
         # read cell
         group = self.trajectory['/initialstate/cell']
@@ -361,11 +590,38 @@ class TrajectoryHDF5(TrajectoryBase):
 
     def read_sample(self, frame, unfolded=False):
         # TODO: due to unfolded argument this differs from the base class method Can we drop this?
+        return self._read_samples([frame], unfolded)[0]
+
+    def read_samples(self, frames, unfolded=False):
+        """
+        Return the list of systems stored at indices `frames`.
+
+        Each per-sample property is read with a single access to the
+        file, which is much faster than calling `read_sample()` for
+        each frame.
+
+        In parallel mode, this must be called by all processes with
+        the same `frames`. Each process reads a contiguous block of
+        `frames` and the systems are then gathered by all processes.
+        """
+        if not self.parallel:
+            return self._read_samples(frames, unfolded)
+        frames = list(frames)
+        first, last = rank * len(frames) // size, (rank + 1) * len(frames) // size
+        systems = self._read_samples(frames[first: last], unfolded)
+        return [system for block in comm.allgather(systems) for system in block]
+
+    def _read_samples(self, frames, unfolded=False):
         # We must increase frame by 1 if we iterate over frames with len().
         # This is some convention to be fixed once and for all
         # TODO: read cell on the fly NPT
-        keys = list(self.trajectory['/trajectory/realtime/stepindex'].keys())
-        csample = '/' + keys[frame]
+        if not self._initialized_read:
+            self.read_init()
+            self._initialized_read = True
+        if self._buffered_samples > 0:
+            self.flush()
+        frames = [frame + len(self) if frame < 0 else frame for frame in frames]
+        csamples = self._csamples(frames)
         # read particles
         group = self.trajectory['/trajectory/particle']
         if unfolded:
@@ -374,61 +630,46 @@ class TrajectoryHDF5(TrajectoryBase):
             else:
                 # fix for unfolded positions that were not written at the first step
                 # should be fixed once and for all in md.x
-                if frame == 0:
-                    pos = self.trajectory['/initialstate/particle/position'][:]
-                else:
-                    pos = group['position_unfolded' + csample][:]
+                pos = [self.trajectory['/initialstate/particle/position'][:] if frame == 0
+                       else group['position_unfolded' + csample][:]
+                       for frame, csample in zip(frames, csamples)]
         else:
-            pos = group['position' + csample][:]
+            pos = self._read_frames('/trajectory/particle/position', frames, csamples)
 
         try:
-            vel = group['velocity' + csample][:]
+            vel = self._read_frames('/trajectory/particle/velocity', frames, csamples)
         except:
-            vel = numpy.zeros([len(pos), ndim])
-
-        # Dynamic properties
-        p = []
-        for r, v in zip(pos, vel):
-            p.append(Particle(position=r, velocity=v))
+            vel = [numpy.zeros([len(x), ndim]) for x in pos]
 
-        # Static properties
-        # TODO: optimize, this takes quite some additional time, almost x2
-        for pi, r in zip(p, self._system.particle):
-            pi.mass = r.mass
-            pi.species = r.species
-            pi.radius = r.radius
-
-        # Try update radii. This must be done after setting defaults.
+        # Try update radii.
         try:
-            r = group['radius' + csample][:]
-            for i, pi in enumerate(p):
-                pi.radius = r[i]
+            rad = self._read_frames('/trajectory/particle/radius', frames, csamples)
             if 'radius' not in self.fields:
                 self.fields.append('radius')
         except KeyError:
+            rad = None
             if 'radius' in self.fields:
                 self.fields.remove('radius')
 
-        # Try update species. This must be done after setting defaults.
-        # TODO: refactor
+        # Try update species.
         try:
-            spe = group['species' + csample][:]
-            for i, pi in enumerate(p):
-                pi.species = spe[i].decode().strip()
+            spe = self._read_frames('/trajectory/particle/species', frames, csamples)
             if 'species' not in self.fields:
                 self.fields.append('species')
         except KeyError:
+            spe = None
             if 'species' in self.fields:
                 self.fields.remove('species')
 
+        # With a variable number of particles, frames are padded to
+        # the largest one. Legacy samples are stored with their size.
+        if 'number_of_particles' in group:
+            nparts = self._read_frames('/trajectory/particle/number_of_particles', frames, csamples)
+        else:
+            nparts = None
+
         # Read cell
-        group = self.trajectory['/trajectory/cell']
-        side = group['sidebox' + csample][:]
-        # This fixes an issue with some hdf5 trajectories that stored
-        # cell as (1,3) array
-        if len(side.shape) == 2:
-            side = side[0]
-        self._system.cell.side = side
+        sides = self._read_frames('/trajectory/cell/sidebox', frames, csamples)
 
         # Read also interaction.
         has_int = True
@@ -437,9 +678,78 @@ class TrajectoryHDF5(TrajectoryBase):
         except:
             has_int = False
 
-        if has_int:
-            self._system.interaction.total_energy = group['energy' + csample][0]
-            self._system.interaction.total_virial = group['virial' + csample][0]
-            self._system.interaction.total_stress = group['stress' + csample][:]
-
-        return System(p, self._system.cell, self._system.interaction)
+        systems = []
+        for i, csample in enumerate(csamples):
+            # Static properties default to those of the initial state.
+            # They are updated below if they are stored in the sample.
+            if nparts is None:
+                npart = len(pos[i])
+            else:
+                npart = nparts[i]
+            ref = self._system.particle[:npart]
+            if len(ref) < npart:
+                ref = ref + [Particle()] * (npart - len(ref))
+            mass = [r.mass for r in ref]
+            if rad is None:
+                rad_i = [r.radius for r in ref]
+            else:
+                rad_i = rad[i]
+            if spe is None:
+                spe_i = [r.species for r in ref]
+            else:
+                spe_i = _decode(spe[i])
+
+            # Particles' positions and velocities are views on the rows of
+            # the arrays read from the file
+            p = [Particle(species=s, mass=m, radius=r, position=x, velocity=v)
+                 for s, m, r, x, v in zip(spe_i, mass, rad_i, pos[i][:npart], vel[i][:npart])]
+
+            # This fixes an issue with some hdf5 trajectories that stored
+            # cell as (1,3) array
+            side = sides[i]
+            if len(side.shape) == 2:
+                side = side[0]
+            cell = Cell(side)
+
+            # Per-sample interaction data are only found in the legacy
+            # layout. Each system gets its own copy of the interaction.
+            interaction = self._system.interaction
+            if has_int and csample is not None and interaction is not None:
+                interaction = copy.copy(interaction)
+                interaction.total_energy = group['energy' + csample][0]
+                interaction.total_virial = group['virial' + csample][0]
+                interaction.total_stress = group['stress' + csample][:]
+
+            system = System(p, cell, interaction)
+            systems.append(system)
+        return systems
+
+    def iter_positions(self, block=256):
+        """
+        Iterate over the particles' positions of all the samples.
+
+        Positions are read in blocks of at most `block` frames with a
+        single access to the file and yielded as arrays of shape
+        (frames, N, ndim). If the number of particles changes across
+        samples, N is the largest one and the positions of missing
+        particles are zero.
+        """
+        if self._buffered_samples > 0:
+            self.flush()
+        for first in range(0, len(self), block):
+            frames = list(range(first, min(first + block, len(self))))
+            yield numpy.asarray(self._read_frames('/trajectory/particle/position',
+                                                  frames, self._csamples(frames)))
+
+    def _csamples(self, frames):
+        # The sample names are only needed by the legacy layout. They
+        # are gathered once, since this layout is read-only.
+        if self._samples is None:
+            node = self.trajectory['/trajectory/realtime/stepindex']
+            if isinstance(node, h5py.Dataset):
+                self._samples = []
+            else:
+                self._samples = ['/' + key for key in node.keys()]
+        if len(self._samples) == 0:
+            return [None] * len(frames)
+        return [self._samples[frame] for frame in frames]
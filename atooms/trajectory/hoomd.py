@@ -4,6 +4,9 @@
 """HOOMD trajectory format"""
 
 import os
+import io
+import re
+import time
 import tarfile
 import numpy
 
@@ -12,7 +15,11 @@ from atooms.system.particle import Particle
 from atooms.system.cell import Cell
 from atooms.system import System
 
-from xml.etree import ElementTree
+# The C accelerator is used by default from python 3.3
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    from xml.etree import ElementTree
 
 
 def map_label_id(names):
@@ -22,6 +29,38 @@ def map_label_id(names):
     return lab
 
 
+def _parse_floats(text, n):
+    """
+    Return an (n, ndim) array of the whitespace separated floats in
+    `text`, which holds `n` rows.
+
+    The text is parsed by numpy in C, without Python float objects.
+    """
+    data = numpy.fromstring(text, dtype=numpy.float64, sep=' ')
+    if n == 0 or data.size % n != 0:
+        raise ValueError('cannot parse %d rows from %d values' % (n, data.size))
+    return data.reshape(n, -1)
+
+_time_step_re = re.compile(br'<configuration\s[^>]*time_step\s*=\s*["\'](\d+)')
+
+def _read_time_step(fh, size=4096):
+    """
+    Return the time step of the configuration stored in file object `fh`.
+
+    The time step is searched in the first `size` bytes of the file.
+    If it is not there, the file is parsed up to the opening tag of
+    the configuration.
+    """
+    match = _time_step_re.search(fh.read(size))
+    if match is not None:
+        return int(match.group(1))
+    fh.seek(0)
+    for _, element in ElementTree.iterparse(fh, events=('start', )):
+        if element.tag == 'configuration':
+            return int(element.attrib['time_step'])
+    raise ValueError('no configuration in file %s' % fh.name)
+
+
 class TrajectoryHOOMD(TrajectoryBase):
 
     suffix = 'tgz'
@@ -29,21 +68,25 @@ class TrajectoryHOOMD(TrajectoryBase):
     def __init__(self, fname, mode='r'):
 
         super(TrajectoryHOOMD, self).__init__(fname, mode)
-        base = os.path.basename(fname.split('.tgz')[0])
+        self._fmt = {}
+        self._species = {}
+        self._first = None
 
         if mode == 'r':
-            self.__tmp_path = '/tmp/' + base
-            try:
-                os.makedirs(self.__tmp_path)
-            except IOError:
-                pass
-
-            tar = tarfile.open(fname)
-            file_list = sorted([f.name for f in tar.getmembers()])
-            tar.extractall(path=self.__tmp_path)
-            tar.close()
-            self.__f_frames = [os.path.join(self.__tmp_path, f) for f in file_list]
-            # cfg, box, pos, typ, vel = self.__read_one(self.__f_frames[0])
+            # Frames are read straight from the archive members. The
+            # archive is kept open and members are looked up by name,
+            # since TarFile.getmember() scans the whole archive index.
+            self._tar = tarfile.open(fname)
+            # Indexing the archive decompresses it sequentially, so the
+            # time steps are scanned in the same pass to avoid decompressing
+            # it again. Members are read while the archive is iterated.
+            self._members = {}
+            self._time_steps = {}
+            for member in self._tar:
+                if member.isfile():
+                    self._members[member.name] = member
+                    self._time_steps[member.name] = _read_time_step(self._tar.extractfile(member))
+            self.__f_frames = sorted(self._members.keys())
 
         elif mode == 'w':
             pass
@@ -52,19 +95,16 @@ class TrajectoryHOOMD(TrajectoryBase):
             self._tar = tarfile.open(fname, "w:gz")
 
     def read_steps(self):
-        steps = []
-        for f in sorted(self.__f_frames):
-            tree = ElementTree.parse(f)
-            root = tree.getroot()
-            cfg = root.find('configuration')
-            steps.append(int(cfg.attrib['time_step']))
+        # Frames are already sorted by name, which embeds the zero
+        # padded step, so steps are kept in the same order as frames
+        steps = [self._time_steps[f] for f in self.__f_frames]
 
-        # First sort them, then subtract out the first step
-        steps = sorted(steps)
-        return [s - steps[0] for s in steps]
+        # Subtract out the first step
+        first = min(steps) if steps else 0
+        return [s - first for s in steps]
 
     def __read_one(self, fname):
-        tree = ElementTree.parse(fname)
+        tree = ElementTree.parse(self._tar.extractfile(self._members[fname]))
         root = tree.getroot()
         cfg = root.find('configuration')
         box = cfg.find('box')
@@ -74,29 +114,45 @@ class TrajectoryHOOMD(TrajectoryBase):
         except:
             vel = None
         typ = cfg.find('type')
-        # TODO: use tipify here
-        pos_list = [list([float(x) for x in r.split()]) for r in pos.text.strip().split('\n')]
+        # Positions and velocities are parsed at once as (N, ndim) arrays
         box_list = [float(box.attrib[r]) for r in ['lx', 'ly', 'lz']]
         typ_list = typ.text.strip().split('\n')
+        pos_list = _parse_floats(pos.text, len(typ_list))
         if vel is not None:
-            vel_list = [list([float(x) for x in v.split()]) for v in vel.text.strip().split('\n')]
+            vel_list = _parse_floats(vel.text, len(typ_list))
         else:
             vel_list = None
         return cfg, box_list, pos_list, typ_list, vel_list
 
     def read_sample(self, frame):
-        cfg, box, pos, typ, vel = self.__read_one(self.__f_frames[frame])
+        # The first frame is parsed once, since it is often read again,
+        # for instance by decorators. Its arrays are copied so that
+        # systems never share them.
+        if frame == 0 and self._first is not None:
+            box, pos, typ, vel = self._first
+            pos = pos.copy()
+            vel = None if vel is None else vel.copy()
+        else:
+            cfg, box, pos, typ, vel = self.__read_one(self.__f_frames[frame])
+            if frame == 0:
+                self._first = (box, pos.copy(), typ, None if vel is None else vel.copy())
+        # Particles' positions and velocities are views on the rows
+        # of the parsed arrays. Species are shared strings, cached
+        # across frames.
+        species = self._species.setdefault
         if vel is None:
-            particle = [Particle(species=t, position=numpy.array(p)) for p, t in zip(pos, typ)]
+            particle = [Particle(species=species(t, t), position=p) for p, t in zip(pos, typ)]
         else:
-            particle = [Particle(species=t, position=numpy.array(p), velocity=numpy.array(v))
+            particle = [Particle(species=species(t, t), position=p, velocity=v)
                         for p, t, v in zip(pos, typ, vel)]
-        cell = Cell(numpy.array(box))
+        # Cell converts the side to a float64 array by itself
+        cell = Cell(box)
         return System(particle, cell)
 
     def write_sample(self, system, step):
-        ndim = len(system.particle[0].position)
-        n = len(system.particle)
+        particle = system.particle
+        ndim = len(particle[0].position)
+        n = len(particle)
 
         if self.mode == 'w':
             fname = self.filename.split('.tgz')[0] + '_step%010d.xml' % step
@@ -104,43 +160,47 @@ class TrajectoryHOOMD(TrajectoryBase):
             base = os.path.basename(self.filename.split('.tgz')[0])
             fname = base + '_step%010d.xml' % step
 
-        fh = open(fname, 'w')
-        fh.write("""\
+        # The formats of coordinates and types blocks are cached, since
+        # they only depend on the number of particles and dimensions
+        try:
+            fmt, fmt_type = self._fmt[(ndim, n)]
+        except KeyError:
+            fmt, fmt_type = self._fmt[(ndim, n)] = ((ndim * " %g" + "\n") * n, "%s\n" * n)
+        pos = numpy.array([p.position for p in particle], dtype=numpy.float64)
+        vel = numpy.array([p.velocity for p in particle], dtype=numpy.float64)
+
+        # The whole frame is written at once
+        txt = ["""\
 <?xml version="1.0" encoding="UTF-8"?>
 <hoomd_xml version="1.4">
 <configuration time_step="%d" dimensions="%d" natoms="%d" >
 <box lx="%g" ly="%g" lz="%g"/>
-""" % ((step, ndim, n) + tuple(system.cell.side)))
-
-        fh.write("<position num=\"%d\">\n" % n)
-        for p in system.particle:
-            fh.write((ndim*" %g" + "\n") % tuple(p.position))
-        fh.write("</position>\n")
-
-        fh.write("<velocity num=\"%d\">\n" % n)
-        for p in system.particle:
-            fh.write((ndim*" %g" + "\n") % tuple(p.velocity))
-        fh.write("</velocity>\n")
-
-        fh.write("<type num=\"%d\">\n" % n)
-        for p in system.particle:
-            fh.write(("%s\n") % p.species)
-        fh.write("</type>\n")
-
-        fh.write("""\
+""" % ((step, ndim, n) + tuple(system.cell.side)),
+               "<position num=\"%d\">\n" % n,
+               fmt % tuple(pos.ravel().tolist()),
+               "</position>\n",
+               "<velocity num=\"%d\">\n" % n,
+               fmt % tuple(vel.ravel().tolist()),
+               "</velocity>\n",
+               "<type num=\"%d\">\n" % n,
+               fmt_type % tuple([p.species for p in particle]),
+               "</type>\n",
+               """\
 </configuration>
 </hoomd_xml>
-""")
-        fh.close()
-
+"""]
         if self.mode == 'w:gz':
-            self._tar.add(fname)
-            os.remove(fname)
+            # Add the frame to the archive without a temporary file
+            data = ''.join(txt).encode()
+            info = tarfile.TarInfo(fname)
+            info.size = len(data)
+            info.mtime = time.time()
+            info.mode = 0o644
+            self._tar.addfile(info, io.BytesIO(data))
+        else:
+            with open(fname, 'w') as fh:
+                fh.write(''.join(txt))
 
     def close(self):
-        # clean up
-        if self.mode == 'r':
-            import shutil
-            shutil.rmtree(self.__tmp_path)
-        elif self.mode == 'w:gz':
+        if self.mode == 'r' or self.mode == 'w:gz':
             self._tar.close()
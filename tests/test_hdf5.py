@@ -32,6 +32,100 @@ class Test(unittest.TestCase):
             i = t.read_interaction()
             s = t[0]
 
+    @unittest.skipIf(not HAS_HDF5, 'no h5py module')
+    def test_write_read_samples(self):
+        s = System()
+        s.particle = [Particle(species='A', position=[1.0, 1.0, 1.0]),
+                      Particle(species='B', position=[-1.0, 0.0, 0.5])]
+        s.cell = Cell([3.0, 3.0, 3.0])
+        with TrajectoryHDF5('/tmp/test_hdf5.h5', 'w') as t:
+            t.compression = 'gzip'
+            t.flush_every = 2
+            t.fields.append('species')
+            for step in [0, 10, 20]:
+                s.particle[0].position[0] = step / 10.
+                t.write(s, step)
+
+        with TrajectoryHDF5('/tmp/test_hdf5.h5', 'r') as t:
+            self.assertEqual(t.steps, [0, 10, 20])
+            self.assertEqual(len(t), 3)
+            for frame, system in enumerate(t):
+                self.assertEqual(system.particle[0].position[0], float(frame))
+                self.assertEqual(system.particle[1].position[2], 0.5)
+                self.assertEqual(system.particle[1].species, 'B')
+                self.assertEqual(list(system.cell.side), [3.0, 3.0, 3.0])
+
+            systems = t.read_samples([2, 0, 2])
+            self.assertEqual([s.particle[0].position[0] for s in systems], [2.0, 0.0, 2.0])
+            blocks = list(t.iter_positions(block=2))
+            self.assertEqual([b.shape for b in blocks], [(2, 2, 3), (1, 2, 3)])
+            self.assertEqual(blocks[1][0, 0, 0], 2.0)
+
+        # Parallel access falls back to serial access with a single process
+        with TrajectoryHDF5('/tmp/test_hdf5.h5', 'r', parallel=True) as t:
+            systems = t.read_samples(range(len(t)))
+            self.assertEqual([s.particle[0].position[0] for s in systems], [0.0, 1.0, 2.0])
+
+    @unittest.skipIf(not HAS_HDF5, 'no h5py module')
+    def test_write_modified(self):
+        """Particles reordered or reassigned after reading are written as they are"""
+        s = System([Particle(species=c, position=[float(i), 0.0, 0.0]) for i, c in enumerate('ABAB')],
+                   Cell([9.0, 9.0, 9.0]))
+        with TrajectoryHDF5('/tmp/test_hdf5.h5', 'w') as t:
+            t.fields.append('species')
+            t.write(s, 0)
+        with TrajectoryHDF5('/tmp/test_hdf5.h5', 'r') as t:
+            s = t[0]
+        s.particle.sort(key=lambda p: p.species)
+        s.particle[3].position = [5.0, 5.0, 5.0]
+        with TrajectoryHDF5('/tmp/test_hdf5.h5', 'w') as t:
+            t.fields.append('species')
+            t.write(s, 0)
+        with TrajectoryHDF5('/tmp/test_hdf5.h5', 'r') as t:
+            self.assertEqual([(p.species, p.position[0]) for p in t[0].particle],
+                             [('A', 0.0), ('A', 2.0), ('B', 1.0), ('B', 5.0)])
+
+    @unittest.skipIf(not HAS_HDF5, 'no h5py module')
+    def test_grandcanonical(self):
+        """The number of particles may change across samples"""
+        def write(numbers, flush_every):
+            with TrajectoryHDF5('/tmp/test_hdf5.h5', 'w') as t:
+                t.flush_every = flush_every
+                t.fields.append('species')
+                for step, n in enumerate(numbers):
+                    s = System([Particle(species='A', position=[float(i), 1.0, 1.0]) for i in range(n)],
+                               Cell([3.0, 3.0, 3.0]))
+                    t.write(s, step)
+
+        for flush_every in [1, 2]:
+            write([2, 1, 3], flush_every)
+            with TrajectoryHDF5('/tmp/test_hdf5.h5', 'r') as t:
+                self.assertEqual([len(system.particle) for system in t], [2, 1, 3])
+                self.assertEqual([p.position[0] for p in t[1].particle], [0.0])
+                self.assertEqual([p.position[0] for p in t[2].particle], [0.0, 1.0, 2.0])
+                self.assertEqual(t[0].particle[1].species, 'A')
+                blocks = list(t.iter_positions())
+                self.assertEqual(blocks[0].shape, (3, 3, 3))
+                self.assertEqual(blocks[0][0, 2, 0], 0.0)
+
+            # Samples without particles
+            for numbers in [[0, 2], [2, 0, 1]]:
+                write(numbers, flush_every)
+                with TrajectoryHDF5('/tmp/test_hdf5.h5', 'r') as t:
+                    self.assertEqual([len(system.particle) for system in t], numbers)
+                    self.assertEqual(t[-1].particle[0].position[0], 0.0)
+
+    @unittest.skipIf(not HAS_HDF5, 'no h5py module')
+    def test_update(self):
+        s = System([Particle()], Cell([3.0, 3.0, 3.0]))
+        with TrajectoryHDF5('/tmp/test_hdf5.h5', 'w') as t:
+            t.write(s, 0)
+        with TrajectoryHDF5('/tmp/test_hdf5.h5', 'r+') as t:
+            t.timestep = 0.5
+            self.assertEqual(t.steps, [0])
+        with TrajectoryHDF5('/tmp/test_hdf5.h5', 'r') as t:
+            self.assertEqual(t.timestep, 0.5)
+
     @unittest.skipIf(not HAS_HDF5, 'no h5py module')
     def test_fmt(self):
         with TrajectoryHDF5('/tmp/test_hdf5.h5', 'w') as t:
@@ -157,6 +157,18 @@ class Test(unittest.TestCase):
         s.run()
         self.assertEqual(db, [0, 1, 2, 4, 8])
 
+    def test_never(self):
+        """Observers that are never notified do not stop the simulation"""
+        def store_list(s, db):
+            db.append(s.current_step)
+        db = []
+        s = Simulation(DryRun(), output_path=None, steps=18)
+        s.add(store_list, Scheduler(seconds=10.), db=db)
+        s.add(store_list, Scheduler(), db=db)
+        s.run()
+        self.assertEqual(s.current_step, 18)
+        self.assertEqual(db, [0, 0])
+
     def test_system(self):
         """
         Test that system in Simulation tracks the one in the backend even
@@ -225,6 +237,84 @@ class Test(unittest.TestCase):
         s.run(100)
         self.assertEqual(s.current_step, 40)
 
+    def test_threaded_io(self):
+        from atooms.system import System, Particle, Cell
+        from atooms.trajectory import TrajectoryXYZ
+
+        # Minimal backend that moves particles along x
+        class Backend(object):
+
+            def __init__(self):
+                self.system = System([Particle(), Particle()], Cell([10.0, 10.0, 10.0]))
+
+            def run(self, steps):
+                for p in self.system.particle:
+                    p.position[0] += steps
+
+        f = '/tmp/test_simulation/threaded/trajectory.xyz'
+        s = Simulation(Backend(), output_path=f, threaded_io=True)
+        s.trajectory_class = TrajectoryXYZ
+        s.add(write_config, Scheduler(10))
+        s.run(50)
+        with TrajectoryXYZ(f) as th:
+            self.assertEqual(th.steps, [0, 10, 20, 30, 40, 50])
+            for step, system in zip(th.steps, th):
+                self.assertEqual(system.particle[0].position[0], step)
+
+    def test_threaded_io_checkpoint(self):
+        """Queued configurations are on disk when a checkpoint is written."""
+        import time
+        from atooms.system import System, Particle, Cell
+        from atooms.trajectory import TrajectoryXYZ
+
+        # Slow trajectory, to keep configurations in the queue
+        class Trajectory(TrajectoryXYZ):
+
+            def write_sample(self, system, step):
+                time.sleep(0.05)
+                super(Trajectory, self).write_sample(system, step)
+
+        # Backend that records the steps on disk at each checkpoint
+        class Backend(object):
+
+            def __init__(self):
+                self.system = System([Particle()], Cell([10.0, 10.0, 10.0]))
+                self.steps = {}
+
+            def run(self, steps):
+                pass
+
+            def write_checkpoint(self, output_path):
+                with TrajectoryXYZ(output_path) as th:
+                    self.steps[s.current_step] = th.steps
+
+        f = '/tmp/test_simulation/threaded_checkpoint/trajectory.xyz'
+        backend = Backend()
+        s = Simulation(backend, output_path=f, checkpoint_interval=20, threaded_io=True)
+        s.trajectory_class = Trajectory
+        s.add(write_config, Scheduler(10))
+        s.run(50)
+        self.assertEqual(backend.steps[20], [0, 10, 20])
+        self.assertEqual(backend.steps[40], [0, 10, 20, 30, 40])
+
+    def test_rmsd_cache(self):
+        """The rmsd is computed by the backend only once per step."""
+        class Backend(DryRun):
+
+            calls = 0
+
+            @property
+            def rmsd(self):
+                self.calls += 1
+                return 0.1
+
+        backend = Backend()
+        s = Simulation(backend, output_path='/tmp/test_simulation/rmsd/trajectory')
+        s.add(write_thermo, Scheduler(10))
+        s.add(target_rmsd, Scheduler(10), 1.0)
+        s.run(50)
+        self.assertEqual(backend.calls, 6)
+
     def tearDown(self):
         rmd('/tmp/test_simulation')
 